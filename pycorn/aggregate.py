@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+'''
+PyCORN - per-fraction summaries of the curves in a loaded run
+'''
+
+
+def frac_bounds(inp, frac_name='Fractions'):
+    '''
+    Returns the fraction marks of a loaded run as a list of
+    (label, start, end) tuples. A fraction spans from its own mark to
+    the next one, the last mark is left open (end = None).
+    '''
+    marks = inp[frac_name]['data']
+    bounds = []
+    for i, (start, label) in enumerate(marks):
+        if i + 1 < len(marks):
+            end = marks[i + 1][0]
+        else:
+            end = None
+        bounds.append((label, start, end))
+    return bounds
+
+
+def segment_starts(xdata, starts):
+    '''
+    Single sorted pass over xdata (volumes, ascending) that returns for
+    every boundary in starts (ascending) the index of the first sample
+    at or beyond it - the bucket offsets for a reduceat-style reduction.
+    '''
+    idx = []
+    n = len(xdata)
+    j = 0
+    for s in starts:
+        while j < n and xdata[j] < s:
+            j += 1
+        idx.append(j)
+    return idx
+
+
+def value_at(x, y, i, v):
+    '''
+    Linear interpolation of the curve at volume v, i is the index of the
+    first sample at or beyond v. None outside the curve.
+    '''
+    if i >= len(x) or (i == 0 and x[0] != v):
+        return None
+    if x[i] == v:
+        return y[i]
+    return y[i - 1] + (y[i] - y[i - 1]) * (v - x[i - 1]) / (x[i] - x[i - 1])
+
+
+def _seg_max(x, y, lo, hi, start, end):
+    if lo == hi:
+        return None
+    return max(y[lo:hi])
+
+
+def _seg_min(x, y, lo, hi, start, end):
+    if lo == hi:
+        return None
+    return min(y[lo:hi])
+
+
+def _seg_mean(x, y, lo, hi, start, end):
+    if lo == hi:
+        return None
+    return sum(y[lo:hi]) / float(hi - lo)
+
+
+def _seg_area(x, y, lo, hi, start, end):
+    '''
+    trapezoidal area under the curve from start to end, the curve is
+    interpolated at both boundaries so the areas of adjacent segments
+    add up to the area of the whole range
+    '''
+    xs = list(x[lo:hi])
+    ys = list(y[lo:hi])
+    y0 = value_at(x, y, lo, start)
+    if y0 is not None and (not xs or xs[0] > start):
+        xs.insert(0, start)
+        ys.insert(0, y0)
+    if end is not None:
+        y1 = value_at(x, y, hi, end)
+        if y1 is not None:
+            xs.append(end)
+            ys.append(y1)
+    area = 0.0
+    for i in range(1, len(xs)):
+        area += (xs[i] - xs[i - 1]) * (ys[i] + ys[i - 1]) / 2.0
+    return round(area, 4)
+
+
+def _seg_first(x, y, lo, hi, start, end):
+    if lo == hi:
+        return None
+    return y[lo]
+
+
+reducers = {'max': _seg_max,
+            'min': _seg_min,
+            'mean': _seg_mean,
+            'area': _seg_area,
+            'first': _seg_first}
+
+
+def default_metrics(inp):
+    '''
+    Metrics used when none are given: max and area for every UV block,
+    mean conductivity and pH at the start of each fraction
+    '''
+    metrics = []
+    for i in inp.keys():
+        if i.startswith('UV') and not i.endswith('_0nm'):
+            metrics.append((i, 'max'))
+            metrics.append((i, 'area'))
+    if 'Cond' in inp:
+        metrics.append(('Cond', 'mean'))
+    if 'pH' in inp:
+        metrics.append(('pH', 'first'))
+    return metrics
+
+
+def fraction_table(inp, metrics=None, frac_name='Fractions'):
+    '''
+    Bins the curves of a loaded run (pc_res3/pc_uni6) by fraction
+    boundaries and reduces each bucket.
+    metrics = list of (data_name, reducer) pairs, reducer is one of
+              max, min, mean, area, first (default: see default_metrics)
+    Returns (columns, rows), one row per fraction:
+    (label, start, end, metric1, metric2, ...)
+    '''
+    if metrics is None:
+        metrics = default_metrics(inp)
+    bounds = frac_bounds(inp, frac_name)
+    starts = [b[1] for b in bounds]
+    columns = ['Fraction', 'Start (ml)', 'End (ml)']
+    results = []
+    # all metrics on the same curve share one pass over its volumes
+    by_curve = {}
+    for name, red in metrics:
+        by_curve.setdefault(name, []).append(red)
+    cache = {}
+    for name, reds in by_curve.items():
+        dat = inp[name]['data']
+        x_dat = [d[0] for d in dat]
+        y_dat = [d[1] for d in dat]
+        idx = segment_starts(x_dat, starts)
+        idx.append(len(x_dat))
+        for red in reds:
+            func = reducers[red]
+            cache[(name, red)] = [func(x_dat, y_dat, idx[k], idx[k + 1],
+                                       bounds[k][1], bounds[k][2])
+                                  for k in range(len(bounds))]
+    for name, red in metrics:
+        try:
+            unit = inp[name]['unit']
+        except KeyError:
+            unit = ''
+        if red == 'area':
+            unit = unit + '*ml'
+        columns.append('{0} {1} ({2})'.format(name, red, unit))
+        results.append(cache[(name, red)])
+    rows = []
+    for k, (label, start, end) in enumerate(bounds):
+        rows.append(tuple([label, start, end] + [r[k] for r in results]))
+    return columns, rows
+
+
+def write_fraction_table(fname, columns, rows, sep=','):
+    '''
+    writes a fraction table to a csv-file
+    '''
+    with open(fname, 'wb') as fout:
+        for line in [columns] + rows:
+            dp = sep.join('' if v is None else str(v) for v in line) + '\r\n'
+            fout.write(dp.encode('utf-8'))
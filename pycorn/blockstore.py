@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+'''
+PyCORN - content addressed store for decoded data blocks
+Resaved res-files differ only in a few header bytes, their (large)
+sensor blocks are byte-identical. The store keeps every decoded block
+once under its content key (pc_res3.block_key) and writes a small json
+manifest per run, so an archive grows with its unique data only.
+
+Layout:
+    <store>/blocks/<key>.volume.npy, .value.npy/.label.npy or .text.npy
+    <store>/runs/<file>_<run_name>.json
+'''
+
+from collections import OrderedDict
+import tempfile
+import hashlib
+import json
+import os
+
+from .npyio import npy_dir_writer, npy_header, write_block, header_meta, load_npy, str_chunks
+
+
+class atomic_npy_writer(npy_dir_writer):
+    '''
+    npy_dir_writer that only makes complete files visible, so readers
+    (and concurrent writers of the same block) never see partial blocks.
+    Every write goes to its own temporary file; blocks are immutable, so
+    a file that is already in place counts as written.
+    '''
+    def add(self, name, descr, shape, chunks):
+        target = os.path.join(self.file_name, name + '.npy')
+        if os.path.isfile(target):
+            return
+        fd, tmp = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=self.file_name)
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                fout.write(npy_header(descr, shape))
+                for c in chunks:
+                    fout.write(c)
+            try:
+                os.replace(tmp, target)
+            except OSError:
+                # e.g. target mapped by a reader on Windows
+                if not os.path.isfile(target):
+                    raise
+                os.remove(tmp)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+def content_key(data):
+    '''
+    Key for blocks without a raw block in a file (pc_uni6): hash of the
+    decoded data itself
+    '''
+    h = hashlib.sha1()
+    if isinstance(data, str):
+        h.update(data.encode('utf-8'))
+        return h.hexdigest()
+    for x, y in data:
+        h.update(repr((x, y)).encode('utf-8'))
+    return h.hexdigest()
+
+
+class block_store(object):
+    '''
+    Directory holding unique decoded blocks and per-run manifests.
+    Can be passed to pc_res3.load(block_cache=...) to decode identical
+    blocks only once, also across invocations.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.block_dir = os.path.join(directory, 'blocks')
+        self.run_dir = os.path.join(directory, 'runs')
+        for d in (self.block_dir, self.run_dir):
+            os.makedirs(d, exist_ok=True)
+        self.writer = atomic_npy_writer(self.block_dir)
+        self.hits = 0      # blocks served from the store
+        self.writes = 0    # blocks added to the store
+
+    def path(self, key, part):
+        return os.path.join(self.block_dir, '{0}.{1}.npy'.format(key, part))
+
+    def __contains__(self, key):
+        return (os.path.isfile(self.path(key, 'value')) or
+                os.path.isfile(self.path(key, 'label')) or
+                os.path.isfile(self.path(key, 'text')))
+
+    def get(self, key, default=None):
+        '''
+        Returns a stored block as dict(data=..., data_type=...[, unit=...])
+        '''
+        if os.path.isfile(self.path(key, 'text')):
+            self.hits += 1
+            return dict(data=load_npy(self.path(key, 'text')), data_type='meta')
+        info = {}
+        if os.path.isfile(self.path(key, 'info')):
+            info = json.loads(load_npy(self.path(key, 'info')))
+        if os.path.isfile(self.path(key, 'value')):
+            y_dat = load_npy(self.path(key, 'value'))
+            data_type = 'curve'
+        elif os.path.isfile(self.path(key, 'label')):
+            y_dat = load_npy(self.path(key, 'label'))
+            data_type = 'annotation'
+        else:
+            return default
+        x_dat = load_npy(self.path(key, 'volume'))
+        entry = dict(data=list(zip(x_dat.tolist(), list(y_dat))), data_type=data_type)
+        entry.update(info)
+        self.hits += 1
+        return entry
+
+    def __getitem__(self, key):
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __setitem__(self, key, entry):
+        '''
+        Stores a decoded block (dict with data, data_type, unit) unless
+        a block with that key exists already
+        '''
+        if key in self:
+            return
+        if 'unit' in entry:
+            info = json.dumps(dict(unit=entry['unit']))
+            self.writer.add(key + '.info', '<U{0}'.format(len(info)), (),
+                            str_chunks([info], len(info), 1))
+        write_block(self.writer, key, entry['data'])
+        self.writes += 1
+
+    def add_run(self, inp):
+        '''
+        Stores all blocks of a loaded run that are not in the store yet
+        and writes the run manifest. Returns (new blocks, reused blocks);
+        blocks already stored while loading with block_cache=store count
+        as reused.
+        '''
+        new = reused = 0
+        meta = header_meta(inp)
+        for entry in meta['blocks']:
+            dat = inp[entry['data_name']]
+            key = dat.get('d_key')
+            if key is None:
+                if 'd_start' in dat and hasattr(inp, 'block_key'):
+                    key = inp.block_key(dat)
+                else:
+                    key = content_key(dat['data'])
+            entry['key'] = key
+            if key in self:
+                reused += 1
+            else:
+                self[key] = dat
+                new += 1
+        with open(self.manifest_path(inp), 'w') as f:
+            json.dump(meta, f, indent=1)
+        return new, reused
+
+    def manifest_path(self, inp):
+        base = os.path.splitext(os.path.basename(inp.file_name))[0]
+        return os.path.join(self.run_dir, '{0}_{1}.json'.format(base, inp.run_name))
+
+    def runs(self):
+        '''
+        Names of all runs in the store
+        '''
+        return sorted(n[:-5] for n in os.listdir(self.run_dir) if n.endswith('.json'))
+
+    def load_run(self, name):
+        '''
+        Returns a stored run as OrderedDict data_name: block dict (with
+        data), header metadata is available as .meta
+        '''
+        with open(os.path.join(self.run_dir, name + '.json')) as f:
+            meta = json.load(f)
+        run = stored_run()
+        run.meta = meta
+        run.file_name = meta['file_name']
+        run.run_name = meta['run_name']
+        run.inject_vol = meta['inject_vol']
+        for entry in meta['blocks']:
+            dat = dict(entry)
+            dat.update(self[entry['key']])
+            run[entry['data_name']] = dat
+        return run
+
+    def size(self):
+        '''
+        Total size of the stored blocks in bytes
+        '''
+        return sum(os.path.getsize(os.path.join(self.block_dir, n))
+                   for n in os.listdir(self.block_dir) if n.endswith('.npy'))
+
+
+class stored_run(OrderedDict):
+    '''
+    A run loaded back from a block_store
+    '''
+    pass
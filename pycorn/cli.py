@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+'''
+PyCORN - command line interface (installed as `pycorn`)
+Subcommands: check, info, export, plot, index, watch
+Heavy dependencies (matplotlib, xlsxwriter) are only imported by the
+subcommands that need them, so check/info start fast.
+'''
+
+import argparse
+import sys
+
+from .pycorn import pc_res3, pc_uni6
+
+pcscript_version = '0.20'
+
+# modules the check/info paths must not pull in
+heavy_modules = ('matplotlib', 'mpl_toolkits', 'xlsxwriter', 'numpy')
+# cold start budget (ms) for importing the cli and parsing check/info
+startup_budget_ms = 150
+
+
+def load_file(fname, args, load=True, block_cache=None):
+    '''
+    Opens a res/zip-file and (unless load=False) decodes it
+    '''
+    inject = args.inject if getattr(args, 'inject', None) is not None else -1
+    if (fname[-3:]).lower() == "zip":
+        fdata = pc_uni6(fname)
+        if load:
+            fdata.load()
+            fdata.xml_parse()
+            fdata.clean_up()
+        return fdata
+    fdata = pc_res3(fname, reduce=getattr(args, 'reduce', 1), inj_sel=inject)
+    if load:
+        fdata.load(block_cache=block_cache)
+    return fdata
+
+
+def data_writer1(fname, inp):
+    '''
+    writes sensor/run-data to csv-files
+    '''
+    for i in inp.keys():
+        print("Writing: " + inp[i]['data_name'])
+        outfile_base = fname[:-4] + "_" + inp.run_name + "_" + inp[i]['data_name']
+        type = inp[i]['data_type']
+        if type == 'meta':
+            data = inp[i]['data']
+            data_to_write = data.encode('utf-8')
+            ext = '.txt'
+            with open(outfile_base + ext, 'wb') as fout:
+                fout.write(data_to_write)
+        else:
+            ext = '.csv'
+            sep = ','
+            with open(outfile_base + ext, 'wb') as fout:
+                for x, y in inp[i]['data']:
+                    dp = str(x) + sep + str(y) + str('\r\n')
+                    data_to_write = dp.encode('utf-8')
+                    fout.write(data_to_write)
+
+
+def generate_xls(inp, fname):
+    '''
+    Input = pycorn object
+    output = xlsx file
+    '''
+    try:
+        import xlsxwriter
+    except ImportError:
+        print("WARNING: xlsxwriter not found - xlsx-output disabled!")
+        return
+    xls_filename = fname[:-4] + "_" + inp.run_name + ".xlsx"
+    workbook = xlsxwriter.Workbook(xls_filename)
+    worksheet = workbook.add_worksheet()
+    writable_blocks = [inp.Fractions_id, inp.Fractions_id2, inp.SensData_id, inp.SensData_id2]
+    d_list = []
+    for i in inp.keys():
+        if inp[i]['magic_id'] in writable_blocks:
+            d_list.append(i)
+    for i in d_list:
+        try:
+            unit = inp[i]['unit']
+        except KeyError:
+            unit = 'Fraction'
+        header1 = (inp[i]['data_name'], '')
+        header2 = ('ml', unit)
+        dat = [header1, header2] + list(inp[i]['data'])
+        row = 0
+        col = d_list.index(i) * 2
+        print("Writing: " + i)
+        for x_val, y_val in (dat):
+            worksheet.write(row, col, x_val)
+            worksheet.write(row, col + 1, y_val)
+            row += 1
+    workbook.close()
+    print("Data written to: " + xls_filename)
+
+
+def frac_table_writer(fname, inp):
+    '''
+    writes per-fraction summary table to a csv-file
+    '''
+    from .aggregate import fraction_table, write_fraction_table
+    if 'Fractions' not in inp:
+        print("No fractions found - skipping fraction table")
+        return
+    columns, rows = fraction_table(inp)
+    outfile = fname[:-4] + "_" + inp.run_name + "_fraction_table.csv"
+    write_fraction_table(outfile, columns, rows)
+    print("Fraction table written to: " + outfile)
+
+
+def wide_writer(fname, inp, step=None, xmin=None, xmax=None):
+    '''
+    writes all curves on a common volume grid to a single csv-file
+    '''
+    from .resample import resample, write_wide_csv
+    grid, columns, matrix = resample(inp, step=step, xmin=xmin, xmax=xmax)
+    outfile = fname[:-4] + "_" + inp.run_name + "_wide.csv"
+    write_wide_csv(outfile, grid, columns, matrix)
+    print("Resampled data written to: " + outfile)
+
+
+def array_writer(fname, inp, fmt, compress=True):
+    '''
+    writes all data blocks as typed arrays to a npz-archive or npy-directory
+    '''
+    from .npyio import export_arrays
+    out_name = fname[:-4] + "_" + inp.run_name
+    if fmt == 'npz':
+        out_name = out_name + ".npz"
+    else:
+        out_name = out_name + "_npy"
+    export_arrays(inp, out_name, fmt=fmt, compress=compress)
+    print("Data written to: " + out_name)
+
+
+def cmd_check(args):
+    ok = True
+    for fname in args.inp_res:
+        fdata = load_file(fname, args, load=False)
+        if hasattr(fdata, 'input_check'):
+            ok = fdata.input_check(show=not args.quiet) and ok
+        else:
+            print(" ---- \n Input file: {0}\n No check available for zip-bundles".format(fname))
+    return 0 if ok else 1
+
+
+def cmd_info(args):
+    for fname in args.inp_res:
+        fdata = load_file(fname, args, load=False)
+        if not isinstance(fdata, pc_res3):
+            print(" ---- \n Input file: {0}\n No header info for zip-bundles".format(fname))
+            continue
+        fdata.readheader()
+        fdata.showheader(full=not args.brief)
+        if args.points:
+            fdata.inject_det(show=True)
+        if args.user:
+            print("User: " + fdata.get_user())
+    return 0
+
+
+def cmd_export(args):
+    store = open_store(args)
+    for fname in args.inp_res:
+        fdata = load_file(fname, args, block_cache=store)
+        export_file(fname, fdata, args, store=store)
+    if store is not None:
+        print("Store: {0} blocks decoded, {1} taken from store, {2} bytes".format(
+            store.writes, store.hits, store.size()))
+    return 0
+
+
+def cmd_plot(args):
+    try:
+        from .plotting import plotterX
+    except ImportError:
+        print("ERROR: Matplotlib not found - Plotting disabled!")
+        return 1
+    for fname in args.inp_res:
+        fdata = load_file(fname, args)
+        plotterX(fdata, fname, args)
+    return 0
+
+
+def cmd_index(args):
+    from .pyramid import build_pyramids, save_pyramids
+    for fname in args.inp_res:
+        fdata = load_file(fname, args)
+        pyrs = build_pyramids(fdata, factor=args.factor)
+        print("Pyramids written to: " + save_pyramids(fdata, pyrs))
+    return 0
+
+
+def open_store(args):
+    '''
+    block store for -f store, None for other formats
+    '''
+    if args.format != 'store':
+        return None
+    from .blockstore import block_store
+    return block_store(args.store)
+
+
+def export_file(fname, fdata, args, store=None):
+    '''
+    runs the exports selected in args (export/watch) for a loaded file
+    '''
+    if store is not None:
+        store.add_run(fdata)
+        print("Stored: {0} in {1}".format(fname, args.store))
+    if args.format == 'csv':
+        data_writer1(fname, fdata)
+    elif args.format == 'xlsx':
+        generate_xls(fdata, fname)
+    elif args.format in ('npz', 'npy'):
+        array_writer(fname, fdata, args.format, compress=not args.no_compress)
+    if args.frac_table:
+        frac_table_writer(fname, fdata)
+    if args.wide:
+        wide_writer(fname, fdata, step=args.step, xmin=args.xmin, xmax=args.xmax)
+
+
+def cmd_watch(args):
+    import threading
+    import time
+    from .ingest import folder_ingest
+    plotterX = None
+    if args.plot:
+        try:
+            # plots are drawn on worker threads, GUI backends need the main thread
+            import matplotlib
+            matplotlib.use('Agg')
+            from .plotting import plotterX
+        except ImportError:
+            print("WARNING: Matplotlib not found - Plotting disabled!")
+    # pyplot keeps global state, only one plot at a time
+    plot_lock = threading.Lock()
+    plot_args = argparse.Namespace(**vars(args))
+    plot_args.format = args.plot_format
+
+    store = open_store(args)
+
+    def handler(fname):
+        t = time.time()
+        fdata = load_file(fname, args, block_cache=store)
+        export_file(fname, fdata, args, store=store)
+        if plotterX:
+            with plot_lock:
+                plotterX(fdata, fname, plot_args)
+        print("Done: {0} ({1:.2f} s)".format(fname, time.time() - t))
+
+    ingest = folder_ingest(args.directory, handler, workers=args.workers,
+                           queue_size=args.queue, interval=args.interval,
+                           state_file=args.state)
+    if args.stats:
+        def reporter():
+            while not ingest.stop_event.wait(args.stats):
+                print(format_stats(ingest.stats()))
+        t = threading.Thread(target=reporter)
+        t.daemon = True
+        t.start()
+    print("Watching {0} - stop with Ctrl+C".format(args.directory))
+    try:
+        ingest.run()
+    except KeyboardInterrupt:
+        pass
+    ingest.stop()
+    print(format_stats(ingest.stats()))
+    return 0
+
+
+def format_stats(st):
+    lat = ["-" if st[k] is None else "{0:.2f}".format(st[k])
+           for k in ('latency_last', 'latency_mean', 'latency_max')]
+    return ("queue: {0} in flight: {1} waiting: {2} done: {3} failed: {4} "
+            "latency (s) last/mean/max: {5}/{6}/{7}").format(
+                st['queue_depth'], st['in_flight'], st['waiting'],
+                st['processed'], st['failed'], *lat)
+
+
+def startup_check(budget_ms=None):
+    '''
+    Measures in a fresh interpreter how long importing the cli and
+    parsing the check/info commands takes and whether heavy modules got
+    imported on the way. Returns 0 if within budget, 1 otherwise.
+    '''
+    import subprocess
+    if budget_ms is None:
+        budget_ms = startup_budget_ms
+    code = ("import sys, time\n"
+            "t = time.time()\n"
+            "import pycorn.cli as c\n"
+            "p = c.build_parser()\n"
+            "p.parse_args(['check', 'x.res']); p.parse_args(['info', 'x.res'])\n"
+            "ms = (time.time() - t) * 1000\n"
+            "heavy = [m for m in c.heavy_modules if m in sys.modules]\n"
+            "print(ms); print(','.join(heavy))\n")
+    out = subprocess.check_output([sys.executable, '-c', code]).decode('utf-8').splitlines()
+    ms = float(out[0])
+    heavy = [m for m in out[1:] if m]
+    print("Startup (check/info): {0:.1f} ms, budget {1:.1f} ms".format(ms, budget_ms))
+    if heavy:
+        print("Heavy modules imported at startup: " + heavy[0])
+    return 0 if ms <= budget_ms and not heavy else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pycorn",
+        description="Extract data from UNICORN .res files and plot them (matplotlib required)",
+        epilog="Make it so!")
+    parser.add_argument('--version', action='version', version=pcscript_version)
+    parser.add_argument("--startup-check", type=float, nargs='?', const=startup_budget_ms,
+                        default=None, dest='startup_check', metavar="MS",
+                        help="Check that cold start of check/info stays within MS milliseconds "
+                        "(default: {0})".format(startup_budget_ms))
+    sub = parser.add_subparsers(dest='command', metavar='command')
+
+    files = argparse.ArgumentParser(add_help=False)
+    files.add_argument("inp_res", help="Input .res/.zip file(s)", nargs='+', metavar="<file>.res")
+    load = argparse.ArgumentParser(add_help=False)
+    load.add_argument("-i", "--inject", type=int, default=None,
+                      help="Set injection number # as zero retention, use info -t to find injection points",
+                      metavar="#")
+    load.add_argument("-r", "--reduce", type=int, default=1,
+                      help="Write/Plot only every n sample", metavar="#")
+    window = argparse.ArgumentParser(add_help=False)
+    window.add_argument("--xmin", type=float, default=None, help="Lower bound on the x-axis", metavar="#")
+    window.add_argument("--xmax", type=float, default=None, help="Upper bound on the x-axis", metavar="#")
+
+    p = sub.add_parser('check', parents=[files], help="Perform simple check if file is supported")
+    p.add_argument("-q", "--quiet", action="store_true", help="Only set the exit status")
+    p.set_defaults(func=cmd_check)
+
+    p = sub.add_parser('info', parents=[files], help="Display entries in header")
+    p.add_argument("-b", "--brief", action="store_true", help="Omit magic ids")
+    p.add_argument("-t", "--points", action="store_true", help="Display injection points")
+    p.add_argument("-u", "--user", action="store_true", help="Show stored user name")
+    p.set_defaults(func=cmd_info)
+
+    export = argparse.ArgumentParser(add_help=False)
+    export.add_argument("--no_compress", action="store_true", help="Store npz-archives without compression")
+    export.add_argument("--store", type=str, default='pycorn_store', metavar="DIR",
+                        help="Block store for -f store (default: pycorn_store)")
+    export.add_argument("--frac_table", action="store_true",
+                        help="Write per-fraction summary (UV max/area, mean Cond, pH at start) to csv file")
+    export.add_argument("--wide", action="store_true",
+                        help="Write all curves resampled onto a common volume grid to one csv file")
+    export.add_argument("--step", type=float, default=None, metavar="#",
+                        help="Grid spacing in ml for --wide (default: finest sample spacing)")
+    plot = argparse.ArgumentParser(add_help=False)
+    plot.add_argument("--no_fractions", action="store_true", help="Disable plotting of fractions")
+    plot.add_argument("--no_inject", action="store_true", help="Disable plotting of inject marker(s)")
+    plot.add_argument("--no_legend", action="store_true", help="Disable legend for plot")
+    plot.add_argument("--no_title", action="store_true", help="Disable title for plot")
+    plot.add_argument("--par1", type=str, default='Cond',
+                      help="Data for 2nd y-axis (Default=Cond), to disable 2nd y-axis, use --par1 None")
+    plot.add_argument("--par2", type=str, default=None, help="Data for 3rd y-axis (Default=None)")
+    plot.add_argument('-d', '--dpi', default=300, type=int,
+                      help="DPI (dots per inch) for raster images (png, jpg, etc.). Default is 300.")
+    plot_formats = ['svg', 'svgz', 'tif', 'tiff', 'jpg', 'jpeg',
+                    'png', 'ps', 'eps', 'raw', 'rgba', 'pdf', 'pgf']
+
+    p = sub.add_parser('export', parents=[files, load, window, export],
+                       help="Write data blocks to csv/xlsx/npz/npy")
+    p.add_argument("-f", "--format", choices=['csv', 'xlsx', 'npz', 'npy', 'store', 'none'], default='csv',
+                   help="Output format (default: csv), npz/npy write typed binary arrays, "
+                   "store adds each unique data block once to a shared block store")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('plot', parents=[files, load, window, plot], help="Plot curves")
+    p.add_argument('-f', '--format', type=str, choices=plot_formats,
+                   default='pdf', help="File format of plot files (default: pdf)")
+    p.set_defaults(func=cmd_plot)
+
+    p = sub.add_parser('index', parents=[files, load],
+                       help="Build min/max pyramids for fast zooming (saved as <file>.pyr.npz)")
+    p.add_argument("--factor", type=int, default=8, metavar="#",
+                   help="Samples per bucket and level (default: 8)")
+    p.set_defaults(func=cmd_index)
+
+    p = sub.add_parser('watch', parents=[load, window, export, plot],
+                       help="Watch a folder and export/plot new or changed files")
+    p.add_argument("directory", help="Folder to watch")
+    p.add_argument("-f", "--format", choices=['csv', 'xlsx', 'npz', 'npy', 'store', 'none'], default='npz',
+                   help="Output format (default: npz)")
+    p.add_argument("-p", "--plot", action="store_true", help="Also plot each file")
+    p.add_argument("--plot_format", type=str, choices=plot_formats, default='pdf', dest='plot_format',
+                   help="File format of plot files (default: pdf)")
+    p.add_argument("-w", "--workers", type=int, default=2, metavar="#",
+                   help="Number of files processed in parallel (default: 2)")
+    p.add_argument("--queue", type=int, default=8, metavar="#",
+                   help="Max. number of files waiting for a worker (default: 8)")
+    p.add_argument("--interval", type=float, default=2.0, metavar="#",
+                   help="Seconds between polls (default: 2)")
+    p.add_argument("--state", type=str, default=None, metavar="FILE",
+                   help="json-file remembering processed files across restarts")
+    p.add_argument("--stats", type=float, default=None, metavar="#",
+                   help="Print queue/latency stats every # seconds")
+    p.set_defaults(func=cmd_watch)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.startup_check is not None:
+        return startup_check(args.startup_check)
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        return 2
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+'''
+PyCORN - incremental ingest of a folder that instruments write results to
+The folder is polled (one directory listing per interval, mtime/size
+from the listing). A file is handed on once it has stopped changing and
+looks complete - for RESv3 the file size recorded in the file must match
+(see pc_res3.input_check), zip-bundles must have their central directory.
+New or changed files are processed by a fixed number of worker threads
+through a bounded queue.
+'''
+
+from collections import deque
+from zipfile import is_zipfile
+import threading
+import struct
+import json
+import time
+import queue
+import os
+
+from .pycorn import pc_res3
+
+
+def fully_written(path):
+    '''
+    True if a res-file carries its final size or a zip-file is complete.
+    Files that cannot be read (yet) - removed, locked by the instrument -
+    are not complete.
+    '''
+    try:
+        if path.lower().endswith('.res'):
+            with open(path, 'rb') as f:
+                head = f.read(20)
+            if len(head) < 20 or not head.startswith(pc_res3.RES_magic_id):
+                return False
+            return struct.unpack("i", head[16:20])[0] == os.path.getsize(path)
+        return is_zipfile(path)
+    except OSError:
+        return False
+
+
+class folder_ingest(object):
+    '''
+    Watches directory and calls handler(path) for every new or changed
+    result file. Files the handler failed on are retried once they change.
+    workers    = number of worker threads
+    queue_size = max. number of files waiting for a worker, further
+                 files are picked up by later polls
+    interval   = seconds between polls
+    settle     = number of polls a file must stay unchanged
+    state_file = json-file remembering processed files across restarts
+    '''
+    def __init__(self, directory, handler, workers=2, queue_size=8, interval=2.0,
+                 settle=1, extensions=('.res', '.zip'), state_file=None):
+        # absolute paths, so the state matches however the folder was given
+        self.directory = os.path.abspath(directory)
+        self.handler = handler
+        self.workers = workers
+        self.interval = interval
+        self.settle = settle
+        self.extensions = extensions
+        self.state_file = state_file
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.done = {}       # path: (mtime, size) of processed version
+        self.pending = {}    # path: [(mtime, size), unchanged polls]
+        self.queued = set()
+        self.failed_sigs = {}  # path: (mtime, size) of a version that failed
+        self.processed = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=1000)  # seconds from queueing to finished
+        if state_file and os.path.isfile(state_file):
+            with open(state_file) as f:
+                self.done = dict((os.path.abspath(k), tuple(v))
+                                 for k, v in json.load(f).items())
+
+    def scan(self):
+        '''
+        One poll: updates pending files and queues the ready ones
+        '''
+        found = set()
+        with os.scandir(self.directory) as entries:
+            listing = [e for e in entries if e.name.lower().endswith(self.extensions)]
+        for entry in listing:
+            path = entry.path
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            sig = (st.st_mtime, st.st_size)
+            found.add(path)
+            with self.lock:
+                # failed versions are only retried once the file changes
+                skip = (self.done.get(path) == sig or path in self.queued or
+                        self.failed_sigs.get(path) == sig)
+            if skip:
+                continue
+            prev = self.pending.get(path)
+            if prev is None or prev[0] != sig:
+                self.pending[path] = [sig, 0]
+                if self.settle > 0:
+                    continue
+            else:
+                prev[1] += 1
+            if self.pending[path][1] < self.settle or not fully_written(path):
+                continue
+            # marked before queueing, a worker may finish it right away
+            with self.lock:
+                self.queued.add(path)
+            try:
+                self.queue.put_nowait((path, sig, time.time()))
+            except queue.Full:
+                # stays pending, retried with the next poll
+                with self.lock:
+                    self.queued.discard(path)
+                continue
+            del self.pending[path]
+        for path in list(self.pending):
+            if path not in found:
+                del self.pending[path]
+        # forget files that were removed from the folder
+        with self.lock:
+            for d in (self.done, self.failed_sigs):
+                for path in [p for p in d if p not in found]:
+                    del d[path]
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            path, sig, t_queued = item
+            try:
+                self.handler(path)
+                ok = True
+            except Exception as e:
+                print("Failed: {0} ({1})".format(path, e))
+                ok = False
+            with self.lock:
+                self.queued.discard(path)
+                if ok:
+                    self.processed += 1
+                    self.done[path] = sig
+                    self.failed_sigs.pop(path, None)
+                    self.latencies.append(time.time() - t_queued)
+                    try:
+                        self.save_state()
+                    except Exception as e:
+                        # keep the worker alive, state is written again with the next file
+                        print("Failed to save state: {0} ({1})".format(self.state_file, e))
+                else:
+                    self.failed += 1
+                    self.failed_sigs[path] = sig
+            self.queue.task_done()
+
+    def save_state(self):
+        if not self.state_file:
+            return
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.done, f)
+        os.replace(tmp, self.state_file)
+
+    def stats(self):
+        '''
+        Returns dict with queue depth, counts and per-file latency (s)
+        of the last 1000 files
+        '''
+        with self.lock:
+            lat = list(self.latencies)
+            in_flight = len(self.queued)
+            processed, failed = self.processed, self.failed
+        return dict(queue_depth=self.queue.qsize(),
+                    in_flight=in_flight,
+                    waiting=len(self.pending),
+                    processed=processed,
+                    failed=failed,
+                    latency_last=lat[-1] if lat else None,
+                    latency_mean=sum(lat) / len(lat) if lat else None,
+                    latency_max=max(lat) if lat else None)
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self.worker)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def stop(self):
+        '''
+        Ends run() after the current poll, queued files are still processed
+        '''
+        self.stop_event.set()
+
+    def run(self, polls=None):
+        '''
+        Polls until stop() is called (or polls polls were made), then
+        waits for the queued files and ends the workers
+        '''
+        if not self.threads:
+            self.start()
+        n = 0
+        try:
+            while not self.stop_event.is_set():
+                self.scan()
+                n += 1
+                if polls is not None and n >= polls:
+                    break
+                self.stop_event.wait(self.interval)
+        finally:
+            for t in self.threads:
+                self.queue.put(None)
+            for t in self.threads:
+                t.join()
+            self.threads = []
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+'''
+PyCORN - columnar binary export of loaded runs
+Curves, annotations and header metadata are written as typed arrays in
+the numpy .npy layout, either bundled into a (compressed) .npz archive
+or as a directory of .npy files that can be memory mapped directly.
+numpy is not required for writing (or for reading back with load_npy).
+'''
+
+from array import array
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+import struct
+import json
+import mmap
+import ast
+import sys
+import os
+
+npy_magic = b'\x93NUMPY'
+little_endian = sys.byteorder == 'little'
+
+# array.array typecode <-> npy descr
+typecodes = {'d': '<f8', 'i': '<i4'}
+descrs = dict((v, k) for k, v in typecodes.items())
+
+
+def npy_header(descr, shape):
+    '''
+    Returns the version 1.0 .npy header for a C-ordered array
+    '''
+    if len(shape) == 1:
+        shape_str = '({0},)'.format(shape[0])
+    else:
+        shape_str = '(' + ', '.join(str(s) for s in shape) + ')'
+    hdr = "{{'descr': '{0}', 'fortran_order': False, 'shape': {1}, }}".format(descr, shape_str)
+    # data starts at a multiple of 64 bytes, header ends with newline
+    pad = 64 - (len(npy_magic) + 4 + len(hdr) + 1) % 64
+    hdr = hdr + ' ' * (pad % 64) + '\n'
+    return npy_magic + b'\x01\x00' + struct.pack('<H', len(hdr)) + hdr.encode('latin1')
+
+
+def num_chunks(values, typecode, chunk):
+    '''
+    yields the raw little-endian bytes of values in pieces of chunk items
+    '''
+    for i in range(0, len(values), chunk):
+        a = array(typecode, values[i:i + chunk])
+        if not little_endian:
+            a.byteswap()
+        yield a.tobytes()
+
+
+def str_chunks(values, width, chunk):
+    '''
+    yields fixed-width UTF-32 (npy '<U') encoded strings
+    '''
+    for i in range(0, len(values), chunk):
+        yield b''.join(v.ljust(width, u'\x00').encode('utf-32-le')
+                       for v in values[i:i + chunk])
+
+
+class npz_writer(object):
+    '''
+    Writes arrays one by one into a .npz (zip) archive. Every member is
+    streamed in chunks, so only one chunk is held in memory at a time.
+    '''
+    def __init__(self, file_name, compress=True):
+        self.file_name = file_name
+        self.zfile = ZipFile(file_name, 'w', ZIP_DEFLATED if compress else ZIP_STORED)
+
+    def add(self, name, descr, shape, chunks):
+        with self.zfile.open(name + '.npy', 'w', force_zip64=True) as fout:
+            fout.write(npy_header(descr, shape))
+            for c in chunks:
+                fout.write(c)
+
+    def close(self):
+        self.zfile.close()
+
+
+class npy_dir_writer(object):
+    '''
+    Writes arrays as individual .npy files into a directory. The files
+    are uncompressed and can be memory mapped (load_npy, numpy.load with
+    mmap_mode='r').
+    '''
+    def __init__(self, file_name):
+        self.file_name = file_name
+        os.makedirs(file_name, exist_ok=True)
+
+    def add(self, name, descr, shape, chunks):
+        with open(os.path.join(self.file_name, name + '.npy'), 'wb') as fout:
+            fout.write(npy_header(descr, shape))
+            for c in chunks:
+                fout.write(c)
+
+    def close(self):
+        pass
+
+
+def safe_name(name):
+    '''
+    data names may contain path separators, replace them for member names
+    '''
+    return name.replace('/', '_').replace('\\', '_')
+
+
+def hex_id(b):
+    return ' '.join('{0:02X}'.format(c) for c in bytearray(b))
+
+
+def header_meta(inp):
+    '''
+    Collects run and block metadata of a loaded run as a json-able dict
+    '''
+    meta = dict(file_name=inp.file_name,
+                run_name=inp.run_name,
+                inject_vol=inp.inject_vol,
+                injection_points=getattr(inp, 'injection_points', None),
+                blocks=[])
+    if hasattr(inp, 'get_user'):
+        meta['user'] = inp.get_user()
+    for name, dat in inp.items():
+        if not isinstance(dat, dict) or 'data' not in dat:
+            continue
+        entry = dict((k, v) for k, v in dat.items()
+                     if k != 'data' and isinstance(v, (str, int, float)))
+        if isinstance(dat.get('magic_id'), bytes):
+            entry['magic_id'] = hex_id(dat['magic_id'])
+        entry['data_name'] = name
+        entry['member'] = safe_name(name)
+        meta['blocks'].append(entry)
+    return meta
+
+
+def write_block(writer, member, data, chunk=65536):
+    '''
+    Writes the data of one block as <member>.volume/.value (curves),
+    <member>.volume/.label (annotations) or <member>.text (meta)
+    '''
+    if isinstance(data, str):
+        writer.add(member + '.text', '<U{0}'.format(max(len(data), 1)), (),
+                   str_chunks([data], max(len(data), 1), 1))
+        return
+    x_dat = [d[0] for d in data]
+    y_dat = [d[1] for d in data]
+    writer.add(member + '.volume', '<f8', (len(x_dat),), num_chunks(x_dat, 'd', chunk))
+    if all(isinstance(y, (int, float)) for y in y_dat):
+        writer.add(member + '.value', '<f8', (len(y_dat),), num_chunks(y_dat, 'd', chunk))
+    else:
+        y_dat = [u'' if y is None else y for y in y_dat]
+        width = max([len(y) for y in y_dat] + [1])
+        writer.add(member + '.label', '<U{0}'.format(width), (len(y_dat),),
+                   str_chunks(y_dat, width, chunk))
+
+
+def write_arrays(inp, writer, chunk=65536):
+    '''
+    Writes all data blocks of a loaded run (pc_res3/pc_uni6) to writer
+    curves      -> <name>.volume (<f8), <name>.value (<f8)
+    annotations -> <name>.volume (<f8), <name>.label (<U)
+    meta (text) -> <name>.text (<U, 0-d)
+    header      -> __header__ (<U, 0-d, json)
+    '''
+    for name, dat in inp.items():
+        if not isinstance(dat, dict) or 'data' not in dat:
+            continue
+        write_block(writer, safe_name(name), dat['data'], chunk=chunk)
+    hdr = json.dumps(header_meta(inp))
+    writer.add('__header__', '<U{0}'.format(len(hdr)), (), str_chunks([hdr], len(hdr), 1))
+
+
+def export_arrays(inp, out_name, fmt='npz', compress=True, chunk=65536):
+    '''
+    Exports a loaded run to out_name
+    fmt = 'npz' (zip archive, deflate compressed unless compress=False)
+          'npy' (directory of uncompressed, memory-mappable .npy files)
+    '''
+    if fmt == 'npz':
+        writer = npz_writer(out_name, compress=compress)
+    elif fmt == 'npy':
+        writer = npy_dir_writer(out_name)
+    else:
+        raise ValueError("Unknown export format: {0}".format(fmt))
+    try:
+        write_arrays(inp, writer, chunk=chunk)
+    finally:
+        writer.close()
+    return out_name
+
+
+def parse_header(buf):
+    '''
+    Returns (descr, shape, data_offset) of a .npy file/buffer
+    '''
+    if bytes(buf[:6]) != npy_magic:
+        raise ValueError("Not a .npy file")
+    major = bytearray(buf[6:7])[0]
+    if major == 1:
+        hlen = struct.unpack('<H', bytes(buf[8:10]))[0]
+        start = 10
+    else:
+        hlen = struct.unpack('<I', bytes(buf[8:12]))[0]
+        start = 12
+    hdr = ast.literal_eval(bytes(buf[start:start + hlen]).decode('latin1'))
+    if hdr['fortran_order']:
+        raise ValueError("Fortran ordered arrays are not supported")
+    return hdr['descr'], hdr['shape'], start + hlen
+
+
+def load_npy(file_name, use_mmap=True):
+    '''
+    Loads a .npy file written by export_arrays
+    numeric arrays are returned as read-only memoryview (memory mapped
+    if use_mmap is set), string arrays as (list of) str
+    '''
+    with open(file_name, 'rb') as f:
+        if use_mmap:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = f.read()
+    return from_buffer(buf)
+
+
+def from_buffer(buf):
+    '''
+    Interprets a .npy image held in buf (bytes, mmap, memoryview)
+    '''
+    descr, shape, offset = parse_header(buf)
+    body = memoryview(buf)[offset:]
+    if descr.startswith('<U'):
+        width = int(descr[2:]) * 4
+        n = shape[0] if shape else 1
+        vals = [bytes(body[i * width:(i + 1) * width]).decode('utf-32-le').rstrip(u'\x00')
+                for i in range(n)]
+        return vals if shape else vals[0]
+    typecode = descrs[descr]
+    size = array(typecode).itemsize * (shape[0] if shape else 1)
+    if little_endian:
+        return body[:size].cast(typecode)
+    a = array(typecode)
+    a.frombytes(bytes(body[:size]))
+    a.byteswap()
+    return memoryview(a)
+
+
+def load_npz(file_name):
+    '''
+    Reads all members of a .npz archive written by export_arrays into
+    a dict of name: array
+    '''
+    out = {}
+    with ZipFile(file_name) as zfile:
+        for n in zfile.namelist():
+            if n.endswith('.npy'):
+                out[n[:-4]] = from_buffer(zfile.read(n))
+    return out
@@ -3,14 +3,16 @@
 PyCORN - script to extract data from .res (results) files generated
 by UNICORN Chromatography software supplied with ÄKTA Systems
 (c)2014-2016 - Yasar L. Ahmed
-v0.18b
+v0.20
 '''
 
 from __future__ import print_function
 from collections import OrderedDict
 from zipfile import ZipFile
 from zipfile import is_zipfile
+from array import array
 import xml.etree.ElementTree as ET
+import hashlib
 import struct
 import codecs
 import os
@@ -44,6 +46,7 @@ class pc_res3(OrderedDict):
         self.inject_vol = None
         self.header_read = False
         self.run_name = ''
+        self.block_cache = None
 
         with open(self.file_name, 'rb') as f:
             self.raw_data = f.read()
@@ -142,10 +145,22 @@ class pc_res3(OrderedDict):
         dec_u = codecs.decode(u[0], 'iso8859-1').rstrip("\x00")
         return dec_u
 
+    def block_key(self, dat):
+        '''
+        Content hash of a data block (d_start..d_end) plus the settings its
+        decoded form depends on. Identical blocks of resaved files share
+        the key even though their magic ids differ (01 14 -> 02 14)
+        '''
+        h = hashlib.sha1(self.raw_data[dat['d_start']:dat['d_end']])
+        h.update(repr((dat['data_name'], self.inject_vol, self.reduce)).encode('utf-8'))
+        return h.hexdigest()
+
     def dataextractor(self, dat, show=False):
         '''
         Identify data type by comparing magic id, then run appropriate
         function to extract data, update orig. dict to include new data
+        If a block_cache is set, blocks already decoded (same content
+        hash) are taken from there
         '''
         meta1 = [
             self.Logbook_id, self.Logbook_id2,
@@ -154,17 +169,27 @@ class pc_res3(OrderedDict):
         meta2 = [self.CNotes_id, self.Methods_id]
         sensor = [self.SensData_id, self.SensData_id2]
         if dat['d_size'] == 0:
-            pass
-        elif dat['magic_id'] in meta1:
-            dat.update(data=self.meta1_read(dat, show=show), data_type= 'annotation')
-            return dat
+            return None
+        if self.block_cache is not None:
+            key = self.block_key(dat)
+            dat['d_key'] = key
+            cached = self.block_cache.get(key)
+            if cached is not None:
+                dat.update(cached)
+                return dat
+        if dat['magic_id'] in meta1:
+            decoded = dict(data=self.meta1_read(dat, show=show), data_type= 'annotation')
         elif dat['magic_id'] in meta2:
-            dat.update(data=self.meta2_read(dat, show=show), data_type= 'meta')
-            return dat
+            decoded = dict(data=self.meta2_read(dat, show=show), data_type= 'meta')
         elif dat['magic_id'] in sensor:
             values, unit = self.sensor_read(dat, show=show)
-            dat.update(data=values, unit=unit, data_type= 'curve')
-            return dat
+            decoded = dict(data=values, unit=unit, data_type= 'curve')
+        else:
+            return None
+        if self.block_cache is not None:
+            self.block_cache[key] = decoded
+        dat.update(decoded)
+        return dat
 
     def meta1_read(self, dat, show=False, do_it_for_inj_det=False):
         '''
@@ -209,7 +234,6 @@ class pc_res3(OrderedDict):
         '''
         extracts sensor/run-data and applies correct division
         '''
-        final_data = []
         if "UV" in dat['data_name'] or "Cond" == dat['data_name'] or "Flow" == dat['data_name']:
             sensor_div = 1000.0
         elif "Pressure" in dat['data_name']:
@@ -225,10 +249,17 @@ class pc_res3(OrderedDict):
             # FIX: in some files the unit for temperature reads 'C' instead of '°C' 
             if s_unit_dec == 'C':
                 s_unit_dec = u'°C'
-        for i in range(dat['d_start'], dat['d_end'], 8):
-            sread = struct.unpack("ii", fread[i:i + 8])
-            data = round((sread[0] / 100.0) - self.inject_vol, 4), sread[1] / sensor_div
-            final_data.append(data)
+        # decode the whole block at once as int32 pairs (volume, value)
+        end = dat['d_start'] + (dat['d_end'] - dat['d_start']) // 8 * 8
+        sread = array('i')
+        try:
+            sread.frombytes(fread[dat['d_start']:end])
+        except AttributeError:
+            # Python 2
+            sread.fromstring(fread[dat['d_start']:end])
+        inject_vol = self.inject_vol
+        final_data = [(round((v / 100.0) - inject_vol, 4), s / sensor_div)
+                      for v, s in zip(sread[0::2], sread[1::2])]
         return (final_data[0::self.reduce], s_unit_dec)
 
     def inject_det(self, show=False):
@@ -251,10 +282,14 @@ class pc_res3(OrderedDict):
                 print((" {0} \t {1}").format(x, y))
 
 
-    def load(self, show=False):
+    def load(self, show=False, block_cache=None):
         '''
         extract all data and store in list
+        block_cache = dict (or block_store) shared between loads, identical
+                  data blocks (e.g. of resaved files) are decoded only once.
+                  Cached data is shared between runs and must not be modified
         '''
+        self.block_cache = block_cache
         self.readheader()
         self.run_name = self['Logbook']['run_name']
         self.inject_det()
@@ -263,6 +298,8 @@ class pc_res3(OrderedDict):
         except IndexError:
             print("\n WARNING - Injection point does not exist! Selected default.\n")
             self.inject_vol = self.injection_points[-1]
+        # blocks are decoded one after the other: building the (x, y) tuples
+        # holds the GIL, so decoding them in a thread pool does not scale
         for name, dat in list(self.items()):
             dat = self.dataextractor(dat, show=show)
             if dat is not None:
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+'''
+PyCORN - multi-resolution min/max pyramids for fast zooming of long curves
+Level k of a pyramid holds min/max (and their sample positions) for
+buckets of factor**k samples. A window/width query decomposes every
+output pixel into a handful of buckets, so the cost depends on the
+requested width and not on the number of samples in the window. The
+extrema returned are always exact samples of the curve.
+'''
+
+from bisect import bisect_left, bisect_right
+from array import array
+import json
+import os
+
+from .npyio import npz_writer, num_chunks, str_chunks, load_npz, safe_name
+from .resample import curve_names
+
+
+class minmax_pyramid(object):
+    '''
+    Min/max pyramid of a single curve (xdata ascending)
+    '''
+    def __init__(self, xdata, ydata, factor=8, levels=None):
+        if factor < 2:
+            raise ValueError("Pyramid factor must be at least 2")
+        self.xdata = xdata
+        self.ydata = ydata
+        self.factor = factor
+        if levels is None:
+            levels = self.build()
+        # each level: (mins, imin, maxs, imax), imin/imax are sample indices
+        self.levels = levels
+
+    def build(self):
+        '''
+        Builds all levels bottom-up, every level is factor times smaller
+        '''
+        f = self.factor
+        y = self.ydata
+        n = len(y)
+        levels = []
+        if n <= f:
+            return levels
+        mins, imin, maxs, imax = array('d'), array('i'), array('d'), array('i')
+        for s in range(0, n, f):
+            e = min(s + f, n)
+            lo_i = hi_i = s
+            for i in range(s + 1, e):
+                if y[i] < y[lo_i]:
+                    lo_i = i
+                if y[i] > y[hi_i]:
+                    hi_i = i
+            mins.append(y[lo_i])
+            imin.append(lo_i)
+            maxs.append(y[hi_i])
+            imax.append(hi_i)
+        levels.append((mins, imin, maxs, imax))
+        while len(levels[-1][0]) > f:
+            p_mins, p_imin, p_maxs, p_imax = levels[-1]
+            m = len(p_mins)
+            mins, imin, maxs, imax = array('d'), array('i'), array('d'), array('i')
+            for s in range(0, m, f):
+                e = min(s + f, m)
+                lo_b = hi_b = s
+                for b in range(s + 1, e):
+                    if p_mins[b] < p_mins[lo_b]:
+                        lo_b = b
+                    if p_maxs[b] > p_maxs[hi_b]:
+                        hi_b = b
+                mins.append(p_mins[lo_b])
+                imin.append(p_imin[lo_b])
+                maxs.append(p_maxs[hi_b])
+                imax.append(p_imax[hi_b])
+            levels.append((mins, imin, maxs, imax))
+        return levels
+
+    def range_minmax(self, lo, hi):
+        '''
+        Returns sample indices (imin, imax) of the extrema in samples
+        lo..hi-1, using O(factor * number of levels) buckets
+        '''
+        f = self.factor
+        y = self.ydata
+        best_lo = best_hi = None
+
+        def take(vmin, i_min, vmax, i_max):
+            if best_lo is None:
+                return i_min, i_max
+            return (i_min if vmin < y[best_lo] else best_lo,
+                    i_max if vmax > y[best_hi] else best_hi)
+
+        # level 0 (raw samples) up to the first bucket boundary
+        while lo < hi and (not self.levels or lo % f or hi - lo < f):
+            best_lo, best_hi = take(y[lo], lo, y[lo], lo)
+            lo += 1
+        while hi > lo and hi % f:
+            hi -= 1
+            best_lo, best_hi = take(y[hi], hi, y[hi], hi)
+        lo, hi = lo // f, hi // f
+        for k, (mins, imin, maxs, imax) in enumerate(self.levels):
+            if lo >= hi:
+                break
+            top = k == len(self.levels) - 1
+            while lo < hi and (top or lo % f or hi - lo < f):
+                best_lo, best_hi = take(mins[lo], imin[lo], maxs[lo], imax[lo])
+                lo += 1
+            while hi > lo and hi % f:
+                hi -= 1
+                best_lo, best_hi = take(mins[hi], imin[hi], maxs[hi], imax[hi])
+            lo, hi = lo // f, hi // f
+        return best_lo, best_hi
+
+    def query(self, x_start, x_end, width):
+        '''
+        Returns the curve between x_start and x_end reduced to width
+        pixels as list of (x, y) tuples: for every pixel the samples
+        holding its minimum and maximum, in volume order. Windows with
+        no more than 2 * width samples are returned unreduced.
+        '''
+        x = self.xdata
+        y = self.ydata
+        lo = bisect_left(x, x_start)
+        hi = bisect_right(x, x_end)
+        if hi - lo <= 2 * width:
+            return [(x[i], y[i]) for i in range(lo, hi)]
+        out = []
+        step = (x_end - x_start) / float(width)
+        a = lo
+        for p in range(width):
+            if p == width - 1:
+                b = hi
+            else:
+                b = bisect_left(x, x_start + (p + 1) * step, a, hi)
+            if b > a:
+                i_min, i_max = self.range_minmax(a, b)
+                for i in sorted(set((i_min, i_max))):
+                    out.append((x[i], y[i]))
+            a = b
+        return out
+
+
+def build_pyramids(inp, names=None, factor=8):
+    '''
+    Builds a minmax_pyramid for every curve (or the given names) of a
+    loaded run, returns dict of name: pyramid
+    '''
+    if names is None:
+        names = curve_names(inp)
+    pyrs = {}
+    for name in names:
+        dat = inp[name]['data']
+        pyrs[name] = minmax_pyramid([d[0] for d in dat], [d[1] for d in dat], factor=factor)
+    return pyrs
+
+
+def pyramid_file(inp):
+    '''
+    Name of the file the pyramids of a run are persisted to
+    '''
+    return inp.file_name + '.pyr.npz'
+
+
+def source_info(inp, factor):
+    '''
+    Values that must match for persisted pyramids to be reused
+    '''
+    st = os.stat(inp.file_name)
+    return dict(size=st.st_size, mtime=st.st_mtime, factor=factor,
+                reduce=getattr(inp, 'reduce', 1), inject_vol=inp.inject_vol)
+
+
+def save_pyramids(inp, pyrs, file_name=None):
+    '''
+    Persists pyramids beside the input file (npz, see npyio)
+    '''
+    if file_name is None:
+        file_name = pyramid_file(inp)
+    factor = list(pyrs.values())[0].factor if pyrs else 8
+    info = source_info(inp, factor)
+    info['levels'] = dict((name, len(p.levels)) for name, p in pyrs.items())
+    writer = npz_writer(file_name)
+    try:
+        for name, p in pyrs.items():
+            for k, lvl in enumerate(p.levels):
+                base = '{0}.L{1}.'.format(safe_name(name), k)
+                for part, tc, vals in zip(('min', 'imin', 'max', 'imax'), 'didi', lvl):
+                    writer.add(base + part, '<f8' if tc == 'd' else '<i4',
+                               (len(vals),), num_chunks(vals, tc, 65536))
+        hdr = json.dumps(info)
+        writer.add('__pyramid__', '<U{0}'.format(len(hdr)), (), str_chunks([hdr], len(hdr), 1))
+    finally:
+        writer.close()
+    return file_name
+
+
+def load_pyramids(inp, file_name=None, factor=8):
+    '''
+    Loads persisted pyramids for a loaded run, returns None if there are
+    none or they are out of date
+    '''
+    if file_name is None:
+        file_name = pyramid_file(inp)
+    if not os.path.isfile(file_name):
+        return None
+    arrays = load_npz(file_name)
+    info = json.loads(arrays['__pyramid__'])
+    n_levels = info.pop('levels')
+    if info != source_info(inp, factor):
+        return None
+    pyrs = {}
+    for name, n in n_levels.items():
+        if name not in inp:
+            return None
+        levels = []
+        for k in range(n):
+            base = '{0}.L{1}.'.format(safe_name(name), k)
+            levels.append(tuple(arrays[base + part] for part in ('min', 'imin', 'max', 'imax')))
+        dat = inp[name]['data']
+        pyrs[name] = minmax_pyramid([d[0] for d in dat], [d[1] for d in dat],
+                                    factor=factor, levels=levels)
+    return pyrs
+
+
+def get_pyramids(inp, factor=8, persist=False):
+    '''
+    Returns pyramids for all curves of a loaded run, reusing persisted
+    ones if they are up to date. With persist=True newly built pyramids
+    are saved beside the input file.
+    '''
+    pyrs = load_pyramids(inp, factor=factor)
+    if pyrs is None:
+        pyrs = build_pyramids(inp, factor=factor)
+        if persist:
+            save_pyramids(inp, pyrs)
+    return pyrs
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+'''
+PyCORN - resampling of curves onto a common volume grid
+'''
+
+import os
+
+
+def curve_names(inp):
+    '''
+    Returns the names of all x/y-curves in a loaded run (pc_res3/pc_uni6)
+    '''
+    names = []
+    for i, dat in inp.items():
+        if isinstance(dat, dict) and 'unit' in dat and 'data' in dat:
+            names.append(i)
+    return names
+
+
+def run_label(inp):
+    '''
+    Short name for a run, used to prefix columns of multi-run tables
+    '''
+    return os.path.splitext(os.path.basename(inp.file_name))[0]
+
+
+def make_grid(start, stop, step):
+    '''
+    Returns evenly spaced volumes from start to stop (inclusive)
+    '''
+    if step <= 0:
+        raise ValueError("Grid spacing must be positive")
+    if stop <= start:
+        raise ValueError("Empty volume window: {0} - {1}".format(start, stop))
+    n = int(round((stop - start) / step)) + 1
+    return [round(start + i * step, 4) for i in range(n)]
+
+
+def median_step(xdata):
+    '''
+    median sample spacing of a curve
+    '''
+    deltas = sorted(b - a for a, b in zip(xdata, xdata[1:]) if b > a)
+    if not deltas:
+        return None
+    return deltas[len(deltas) // 2]
+
+
+def interp_sorted(xdata, ydata, grid, fill=None):
+    '''
+    Linear interpolation of a curve (xdata ascending) at the volumes in
+    grid (ascending). Both lists are walked once side by side, points
+    outside the curve are set to fill.
+    '''
+    out = []
+    n = len(xdata)
+    j = 0
+    for g in grid:
+        if n == 0 or g < xdata[0] or g > xdata[-1]:
+            out.append(fill)
+            continue
+        while j < n - 1 and xdata[j + 1] < g:
+            j += 1
+        x0, x1 = xdata[j], xdata[min(j + 1, n - 1)]
+        y0, y1 = ydata[j], ydata[min(j + 1, n - 1)]
+        if x1 == x0:
+            out.append(y0)
+        else:
+            out.append(y0 + (y1 - y0) * (g - x0) / (x1 - x0))
+    return out
+
+
+def resample(runs, names=None, step=None, xmin=None, xmax=None,
+             align='inject', fill=None):
+    '''
+    Puts curves of one or several loaded runs onto a shared volume grid.
+    runs  = loaded pc_res3/pc_uni6 object or list of them
+    names = curves to include (default: all curves of every run)
+    step  = grid spacing in ml (default: finest median spacing of all curves)
+    xmin/xmax = window (default: union of all curves)
+    align = 'inject' keeps volumes relative to the selected injection point
+            (as loaded), 'raw' restores the recorded run volumes
+    fill  = value for grid points outside a curve
+    Returns (grid, columns, matrix) with one matrix row per grid point
+    and one column per run/curve.
+    '''
+    if isinstance(runs, dict):
+        runs = [runs]
+    if align not in ('inject', 'raw'):
+        raise ValueError("align must be 'inject' or 'raw'")
+    multi = len(runs) > 1
+    curves = []
+    for inp in runs:
+        offset = inp.inject_vol if align == 'raw' and inp.inject_vol else 0.0
+        sel = names if names is not None else curve_names(inp)
+        for name in sel:
+            if name not in inp:
+                continue
+            dat = inp[name]['data']
+            x_dat = [d[0] + offset for d in dat]
+            y_dat = [d[1] for d in dat]
+            label = name
+            if multi:
+                label = run_label(inp) + ':' + name
+            curves.append((label, x_dat, y_dat))
+    if not curves:
+        raise ValueError("No curves to resample")
+    if step is None:
+        steps = [median_step(c[1]) for c in curves]
+        steps = [s for s in steps if s]
+        step = min(steps) if steps else 1.0
+    if xmin is None:
+        xmin = min(c[1][0] for c in curves if c[1])
+    if xmax is None:
+        xmax = max(c[1][-1] for c in curves if c[1])
+    grid = make_grid(xmin, xmax, step)
+    columns = [c[0] for c in curves]
+    cols = [interp_sorted(c[1], c[2], grid, fill) for c in curves]
+    matrix = [list(row) for row in zip(*cols)]
+    return grid, columns, matrix
+
+
+def write_wide_csv(fname, grid, columns, matrix, sep=','):
+    '''
+    writes a resampled matrix to a single csv-file, first column is volume
+    '''
+    with open(fname, 'wb') as fout:
+        dp = sep.join(['ml'] + columns) + '\r\n'
+        fout.write(dp.encode('utf-8'))
+        for x, row in zip(grid, matrix):
+            vals = ['' if v is None else str(round(v, 6)) for v in row]
+            dp = sep.join([str(x)] + vals) + '\r\n'
+            fout.write(dp.encode('utf-8'))
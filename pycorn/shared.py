@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+'''
+PyCORN - handing decoded curves to other processes via shared memory
+The curves of a loaded run are copied once into a shared memory segment
+as typed arrays (float64 volume/value columns). Only a small, picklable
+descriptor is sent to the workers, which attach read-only views without
+copying the data. Requires Python 3.8+ (multiprocessing.shared_memory).
+
+Publisher:
+    shm = publish(my_res_file)
+    pool.map(work, [shm.descriptor] * n)
+    ...
+    shm.close()     # frees the segment (also via `with publish(...) as shm`)
+
+Worker:
+    with attach(descriptor) as run:
+        uv = run['UV']['data']      # sequence of (x, y) tuples
+'''
+
+from array import array
+from collections import OrderedDict
+import sys
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+from .resample import curve_names
+
+item_size = array('d').itemsize
+
+
+def _check():
+    if shared_memory is None:
+        raise RuntimeError("Shared memory requires Python 3.8 or newer")
+
+
+def _open_existing(name):
+    '''
+    Opens an existing segment. From Python 3.13 on it is kept away from
+    this process' resource tracker, so that only the publisher removes
+    it. Older versions always track it: pool workers share the tracker of
+    their parent and are fine, unrelated processes should not attach
+    there (their tracker would remove the segment when they exit).
+    '''
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+class shared_run(object):
+    '''
+    Owner of a shared memory segment holding the curves of a run.
+    The segment lives until close() is called.
+    '''
+    def __init__(self, inp, names=None):
+        _check()
+        curves = curve_names(inp)
+        if names is None:
+            names = curves
+        for name in names:
+            if name not in curves:
+                raise ValueError("{0} is not a curve".format(name))
+        blocks = []
+        offset = 0
+        for name in names:
+            n = len(inp[name]['data'])
+            meta = dict((k, v) for k, v in inp[name].items()
+                        if k != 'data' and isinstance(v, (str, int, float, bytes)))
+            blocks.append(dict(name=name, offset=offset, length=n, meta=meta))
+            offset += 2 * n * item_size
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        try:
+            buf = self.shm.buf
+            for b, name in zip(blocks, names):
+                dat = inp[name]['data']
+                n = b['length']
+                x = array('d', [d[0] for d in dat])
+                y = array('d', [d[1] for d in dat])
+                start = b['offset']
+                buf[start:start + n * item_size] = x.tobytes()
+                buf[start + n * item_size:start + 2 * n * item_size] = y.tobytes()
+            del buf
+        except Exception:
+            # do not leave an orphaned segment behind
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+            raise
+        self.descriptor = dict(shm_name=self.shm.name,
+                               file_name=inp.file_name,
+                               run_name=inp.run_name,
+                               inject_vol=inp.inject_vol,
+                               byteorder=sys.byteorder,
+                               blocks=blocks)
+
+    def close(self):
+        '''
+        Releases and removes the segment, attached views become invalid
+        once their processes detach as well
+        '''
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class shared_curve(object):
+    '''
+    Read-only sequence of (x, y) tuples backed by two shared columns,
+    the columns themselves are available as .x and .y (memoryview).
+    Indexing and slicing the curve return copies; views taken from .x/.y
+    directly must be released before the run is detached.
+    '''
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [(self.x[j], self.y[j]) for j in range(*i.indices(len(self.x)))]
+        return (self.x[i], self.y[i])
+
+    def __iter__(self):
+        for j in range(len(self.x)):
+            yield (self.x[j], self.y[j])
+
+
+class attached_run(OrderedDict):
+    '''
+    A run attached from a descriptor, with the same data_name: data
+    layout as pc_res3. Call detach() (or use as context manager) when
+    done; it does not remove the segment.
+    '''
+    def __init__(self, descriptor):
+        OrderedDict.__init__(self)
+        _check()
+        if descriptor['byteorder'] != sys.byteorder:
+            raise ValueError("Shared run was published with different byte order")
+        self.file_name = descriptor['file_name']
+        self.run_name = descriptor['run_name']
+        self.inject_vol = descriptor['inject_vol']
+        self._descriptor = descriptor
+        self._stale = []     # handles that could not be closed yet
+        self.shm = _open_existing(descriptor['shm_name'])
+        self._map()
+
+    def _map(self):
+        self._views = []
+        buf = self.shm.buf.toreadonly()
+        self._views.append(buf)
+        for b in self._descriptor['blocks']:
+            n = b['length']
+            start = b['offset']
+            x = buf[start:start + n * item_size].cast('d')
+            y = buf[start + n * item_size:start + 2 * n * item_size].cast('d')
+            self._views.extend((x, y))
+            dat = dict(b['meta'])
+            dat['data'] = shared_curve(x, y)
+            self[b['name']] = dat
+
+    def _close_stale(self):
+        for shm in list(self._stale):
+            try:
+                shm.close()
+            except BufferError:
+                raise BufferError("Views of the shared columns are still in use, "
+                                  "release them before detaching")
+            self._stale.remove(shm)
+
+    def detach(self):
+        '''
+        Releases all views and closes this process' handle to the segment.
+        Raises BufferError while views taken from the .x/.y columns are
+        still in use; the run then stays attached (with new views), release
+        the old views and call detach() again.
+        '''
+        if self.shm is None:
+            return
+        self._close_stale()
+        self.clear()
+        for v in reversed(self._views):
+            v.release()
+        self._views = []
+        try:
+            self.shm.close()
+        except BufferError:
+            # the old handle stays open as long as outside views exist,
+            # attach again so the run remains usable until then
+            self._stale.append(self.shm)
+            self.shm = _open_existing(self._descriptor['shm_name'])
+            self._map()
+            raise BufferError("Views of the shared columns are still in use, "
+                              "release them before detaching")
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.detach()
+
+
+def publish(inp, names=None):
+    '''
+    Copies the curves of a loaded run into shared memory, returns the
+    owning shared_run (pass shared_run.descriptor to other processes)
+    '''
+    return shared_run(inp, names=names)
+
+
+def attach(descriptor):
+    '''
+    Attaches zero-copy read-only views of a published run
+    '''
+    return attached_run(descriptor)
@@ -7,11 +7,12 @@ except ImportError:
 
 setup(
     name='pycorn',
-    version='0.18',
+    version='0.20',
     author='Yasar L. Ahmed',
     packages=['pycorn'],
     extras_require = {'plotting':  ["matplotlib"], 'xlsx-output': ['xlsxwriter']},
     scripts=['examplescripts/pycorn-bin.py'],
+    entry_points={'console_scripts': ['pycorn = pycorn.cli:main']},
     platforms=['Linux', 'Windows', 'MacOSX'],
     zip_safe=False,
     classifiers=["License :: OSI Approved :: GNU General Public License v2 (GPLv2)",